@@ -2,88 +2,817 @@ import subprocess
 import shutil
 import os
 import tempfile
-import pyperclip
-from pyperclip import PyperclipException
+import sys
 import re
+import json
+import hashlib
+import shlex
+import signal
+import uuid
+import argparse
+import contextlib
+import io
+import multiprocessing
+import functools
+import threading
+try:
+    import fcntl
+except ImportError:
+    # Windows has no fcntl; fast_copy then skips the copy-on-write clone
+    fcntl = None
 
-def run_command(command):
+# Number of sed commands applied together before running cargo
+BATCH_SIZE = 16
+
+# Keep rustc's incremental query cache warm between runs and make sure no
+# ANSI colour codes end up in the output we parse.
+CARGO_ENV = {**os.environ, "CARGO_INCREMENTAL": "1", "CARGO_TERM_COLOR": "never"}
+
+# Arguments of the single cargo invocation that type-checks and builds tests
+CARGO_CHECK_ARGS = ["test", "--no-run", "--message-format=json"]
+
+# Files besides the sources that change what cargo builds or how rustc is
+# invoked, looked for throughout the tree and in every directory above it
+BUILD_INPUT_FILES = (
+    "Cargo.toml", "Cargo.lock", "pyproject.toml", "setup.py",
+    "rust-toolchain", "rust-toolchain.toml",
+    os.path.join(".cargo", "config"), os.path.join(".cargo", "config.toml")
+)
+
+# Diagnostics from these target kinds count as test errors, everything else
+# (lib, bin, build scripts, ...) as check errors
+TEST_TARGET_KINDS = {"test", "bench", "example"}
+
+# Cargo's per-crate warning summary repeats counts already reported as JSON
+# messages, as does its "error: could not compile" line
+WARNING_SUMMARY_PATTERN = re.compile(r'warning: `.*?`.*?generated\s+\d+\s+warnings?')
+
+# Prefix of the temporary files and directories sedloop creates inside the tree
+SCRATCH_PREFIX = ".sedloop_"
+
+# Tokens that can plausibly name a file; quoted sed scripts and flags never do
+PATH_TOKEN_PATTERN = re.compile(r'[\w.+@~/][\w.+@~/-]*')
+
+# Seconds a command run by the persistent shell may take before it is killed
+SHELL_COMMAND_TIMEOUT = 600
+
+# Version control metadata, which cargo never reads, left out of worker copies
+VCS_DIRECTORIES = frozenset({".git", ".hg", ".svn", ".bzr", ".jj", "_darcs"})
+
+class PersistentShell:
     """
-    Executes a shell command and captures its output.
+    A long-lived bash process that runs commands sent over its stdin, saving a
+    shell start-up per command. Each command's output is read up to a sentinel
+    line carrying its exit status.
     """
+
+    def __init__(self):
+        # Its own session lets a hung command be killed with everything it started
+        self.process = subprocess.Popen(
+            ["bash", "--noprofile", "--norc"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            errors="replace",
+            start_new_session=True
+        )
+        self.sentinel = f"__sedloop_done_{uuid.uuid4().hex}__"
+
+    def kill(self):
+        """
+        Kills the shell together with any command still running in it.
+        """
+        try:
+            if hasattr(os, "killpg"):
+                os.killpg(self.process.pid, signal.SIGKILL)
+            else:
+                self.process.kill()
+        except ProcessLookupError:
+            pass
+
+    def run(self, command):
+        """
+        Runs a command and returns its exit status and output. Raises OSError if
+        the shell has gone away or the command did not finish within
+        SHELL_COMMAND_TIMEOUT seconds, in which case the shell is killed.
+        """
+        # The command travels as a single quoted word for eval, so bash never reads
+        # past it, even when it is incomplete (say, an unterminated here-document).
+        # The subshell keeps cd, exit and variable assignments from leaking into
+        # later commands, and stdin is closed so nothing reads our command stream.
+        self.process.stdin.write(
+            f"( eval {shlex.quote(command)} ) </dev/null 2>&1; printf '%s%d\\n' {self.sentinel} $?\n"
+        )
+        self.process.stdin.flush()
+
+        timed_out = threading.Event()
+
+        def kill_on_timeout():
+            timed_out.set()
+            self.kill()
+
+        timer = threading.Timer(SHELL_COMMAND_TIMEOUT, kill_on_timeout)
+        timer.start()
+        try:
+            output = []
+            for line in self.process.stdout:
+                index = line.rfind(self.sentinel)
+                if index != -1:
+                    output.append(line[:index])
+                    return int(line[index + len(self.sentinel):]), "".join(output)
+                output.append(line)
+        except BaseException:
+            self.kill()
+            raise
+        finally:
+            timer.cancel()
+
+        self.process.wait()
+        if timed_out.is_set():
+            raise OSError(f"command timed out after {SHELL_COMMAND_TIMEOUT} seconds")
+        raise OSError("persistent shell exited unexpectedly")
+
+# Started on first use; False once bash turned out to be unavailable
+persistent_shell = None
+
+# Characters that mean something to the shell outside single quotes
+SHELL_SYNTAX_CHARS = frozenset('$`\\"*?[]{}~#;&|<>()!=\n')
+
+def simple_command_argv(command):
+    """
+    Returns the argument list of a command that needs no shell to run, i.e. one
+    whose only shell syntax is single quoting, or None if it needs a shell.
+    """
+    # Nothing is special inside single quotes, so every other segment is unquoted
+    if any(SHELL_SYNTAX_CHARS.intersection(part) for part in command.split("'")[::2]):
+        return None
+    try:
+        argv = shlex.split(command)
+    except ValueError:
+        return None
+    return argv or None
+
+def run_command(command, env=None):
+    """
+    Executes a command and captures its output. An argument list, or a string
+    that uses no shell syntax beyond single quotes, is executed directly. Other
+    strings are run by the shell; in the default environment they go through
+    the persistent shell when it is available.
+    """
+    global persistent_shell
+
+    if isinstance(command, str):
+        argv = simple_command_argv(command)
+        if argv is not None:
+            try:
+                return run_command(argv, env)
+            except OSError:
+                # Not an executable (e.g. a shell builtin), so leave it to the shell
+                pass
+
+    if isinstance(command, str) and env is None and persistent_shell is not False:
+        try:
+            if persistent_shell is None:
+                persistent_shell = PersistentShell()
+        except OSError:
+            persistent_shell = False
+        else:
+            try:
+                return persistent_shell.run(command)
+            except OSError as e:
+                # The command may already have run, so report it as failed
+                # rather than running it again
+                persistent_shell = None
+                return 1, str(e)
+            except BaseException:
+                # run kills the shell on any other error too, so start afresh next time
+                persistent_shell = None
+                raise
+
+    # Our own descriptors are non-inheritable, so skipping the close_fds sweep is safe
     result = subprocess.run(
         command,
-        shell=True,
+        shell=isinstance(command, str),
+        stdin=subprocess.DEVNULL,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
-        text=True
+        text=True,
+        errors="replace",
+        env=env,
+        close_fds=False
     )
     return result.returncode, result.stdout
 
-def parse_cargo_output(output):
+def parse_cargo_output(lines, error_limit=None):
     """
-    Parses the output from cargo commands to count errors and warnings.
+    Parses the output lines from cargo commands to count errors and warnings.
+    Accepts any iterable of lines, so a process's stdout can be parsed while
+    it is still being written. With an error_limit, parsing stops as soon as
+    the total error count exceeds it.
+
+    Compiler diagnostics are read from the JSON messages emitted with
+    --message-format=json and split by the kind of target they belong to.
+    Anything else is cargo's own human-readable output, which is only scanned
+    for cargo-level errors (e.g. a broken manifest) that never reach rustc.
+    Returns (check_errors, check_warnings, test_errors, test_warnings).
     """
-    errors = 0
-    warnings = 0
+    check_errors = 0
+    check_warnings = 0
+    test_errors = 0
+    test_warnings = 0
 
-    # Regex to catch error and warning summaries
-    compile_fail_pattern = re.compile(
-        r'^error:\s+could not compile `.*?`.*?due to\s+(\d+)\s+previous error[s]?;?\s+(\d+)\s+warnings? emitted',
-        re.IGNORECASE
-    )
-    individual_error_pattern = re.compile(r'^\s*error:\s+(?!\[E)')
-    individual_warning_pattern = re.compile(r'^\s*warning:\s+(?!\[E)')
-
-    for line in output.splitlines():
-        compile_fail_match = compile_fail_pattern.match(line)
-        if compile_fail_match:
-            error_count = int(compile_fail_match.group(1))
-            warning_count = int(compile_fail_match.group(2))
-            errors += error_count
-            warnings += warning_count
+    # Bind the per-line lookups to locals once instead of resolving them on every line
+    loads = json.loads
+    is_not_test = TEST_TARGET_KINDS.isdisjoint
+    match_warning_summary = WARNING_SUMMARY_PATTERN.match
+
+    for line in lines:
+        if line.startswith('{'):
+            # Most JSON lines are build artifacts; only decode diagnostics
+            if '"compiler-message"' not in line:
+                continue
+            try:
+                message = loads(line)
+            except ValueError:
+                continue
+            if message.get('reason') != 'compiler-message':
+                continue
+            level = message['message']['level']
+            is_test = not is_not_test(message['target']['kind'])
+            if level == 'error':
+                if is_test:
+                    test_errors += 1
+                else:
+                    check_errors += 1
+                if error_limit is not None and check_errors + test_errors > error_limit:
+                    break
+            elif level == 'warning':
+                if is_test:
+                    test_warnings += 1
+                else:
+                    check_warnings += 1
             continue
 
-        if individual_error_pattern.search(line):
-            errors += 1
+        # Cargo prints its own diagnostics at the start of the line, so prefix
+        # checks classify them; only warning summaries need a pattern
+        if line.startswith('error: '):
+            if line.startswith(('error: could not compile', 'error: [E')):
+                continue
+            check_errors += 1
+            if error_limit is not None and check_errors + test_errors > error_limit:
+                break
+        elif line.startswith('warning: '):
+            if line.startswith('warning: [E') or match_warning_summary(line):
+                continue
+            check_warnings += 1
+
+    return check_errors, check_warnings, test_errors, test_warnings
 
-        if individual_warning_pattern.search(line):
-            warnings += 1
+# The cargo binary to run, resolved on first use
+cargo_binary = None
 
-    return errors, warnings
+def resolve_cargo():
+    """
+    Returns the cargo binary to run. Under rustup, cargo and rustc on PATH are
+    proxies that work out the toolchain on every call, so the toolchain's own
+    binaries are looked up once instead, with rustc passed to cargo via RUSTC.
+    """
+    global cargo_binary
+
+    if cargo_binary is None:
+        cargo_binary = "cargo"
+        cargo_path = shutil.which("cargo", path=CARGO_ENV.get("PATH"))
+        rustup_path = shutil.which("rustup", path=CARGO_ENV.get("PATH"))
+        if cargo_path and rustup_path and os.path.samefile(cargo_path, rustup_path):
+            binaries = {}
+            for name in ("cargo", "rustc"):
+                result = subprocess.run(
+                    ["rustup", "which", name],
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                    text=True,
+                    env=CARGO_ENV
+                )
+                if result.returncode == 0:
+                    binaries[name] = result.stdout.strip()
+            if "cargo" in binaries:
+                cargo_binary = binaries["cargo"]
+            if "rustc" in binaries:
+                CARGO_ENV.setdefault("RUSTC", binaries["rustc"])
+    return cargo_binary
+
+def interrupt_process_group(process):
+    """
+    Interrupts a process started in a session of its own together with the
+    processes it spawned, as Ctrl-C would. Where there are no process groups,
+    only the process itself is terminated.
+    """
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(process.pid, signal.SIGINT)
+        else:
+            process.terminate()
+    except ProcessLookupError:
+        pass
 
 def run_cargo_checks():
     """
-    Runs 'cargo check' and 'cargo test', parsing their outputs.
+    Runs a single 'cargo test --no-run', which type-checks everything 'cargo check'
+    would plus the test targets, and parses its output. Test binaries are only
+    built, not executed. The output is parsed while cargo is still running.
     """
-    _, check_output = run_command("cargo check")
-    check_errors, check_warnings = parse_cargo_output(check_output)
+    counts, _ = run_cargo_checks_until(None)
+    return counts
 
-    _, test_output = run_command("cargo test")
-    test_errors, test_warnings = parse_cargo_output(test_output)
+def run_cargo_checks_until(error_limit):
+    """
+    Like run_cargo_checks, but interrupts cargo as soon as the total error count
+    exceeds error_limit, since the rest of the build cannot lower it. Returns
+    the counts and whether cargo ran to completion; counts from an interrupted
+    run are lower bounds. A failed cargo run counts as at least one error.
+    """
+    # Cargo gets its own process group so it can be interrupted together with
+    # the rustc processes it spawned, as Ctrl-C would
+    process = subprocess.Popen(
+        [resolve_cargo(), *CARGO_CHECK_ARGS],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        env=CARGO_ENV,
+        close_fds=False,
+        start_new_session=True
+    )
+    # Count diagnostics as they arrive instead of buffering the whole transcript
+    with process:
+        try:
+            counts = parse_cargo_output(process.stdout, error_limit)
+        except BaseException:
+            # Ctrl-C no longer reaches cargo's session, and it would otherwise
+            # keep running and holding the target directory lock
+            interrupt_process_group(process)
+            raise
+        finished = error_limit is None or counts[0] + counts[2] <= error_limit
+        if not finished and process.poll() is None:
+            interrupt_process_group(process)
 
-    return check_errors, check_warnings, test_errors, test_warnings
+    # A build that failed without a diagnostic we recognise must not look clean
+    check_errors, check_warnings, test_errors, test_warnings = counts
+    if finished and process.returncode != 0 and check_errors + test_errors == 0:
+        counts = (1, check_warnings, test_errors, test_warnings)
+    return counts, finished
+
+def hash_files(paths):
+    """
+    Returns a mapping of each normalized path to a blake2b digest of the path
+    and the file's contents. Digests are ints so the digests of several files
+    can be combined with XOR in any order. A missing file gets a fixed digest
+    of its own, distinct from that of any contents, so commands that delete
+    files can be evaluated and reverted like any other.
+    """
+    digests = {}
+    for path in paths:
+        path = os.path.normpath(path)
+        try:
+            with open(path, 'rb') as file:
+                key = path.encode() + b'\0' + file.read()
+        except (FileNotFoundError, NotADirectoryError):
+            key = path.encode() + b'\1'
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        digests[path] = int.from_bytes(digest, 'little')
+    return digests
+
+def extract_target_files(sed_command, known_files, is_file_cache):
+    """
+    Returns the arguments of a sed command that name existing regular files;
+    directories and other special files are never targets. Paths in
+    known_files are accepted without touching the filesystem; any other token
+    that looks like a path is checked once and the result kept in
+    is_file_cache.
+    """
+    target_files = []
+    for part in sed_command.split():
+        part_clean = part.rstrip(',;')
+        if os.path.normpath(part_clean) in known_files:
+            target_files.append(part_clean)
+            continue
+        if not PATH_TOKEN_PATTERN.fullmatch(part_clean):
+            continue
+        if part_clean not in is_file_cache:
+            is_file_cache[part_clean] = os.path.isfile(part_clean)
+        if is_file_cache[part_clean]:
+            target_files.append(part_clean)
+    return target_files
+
+# Characters that make a sed pattern or replacement more than plain text
+SED_PATTERN_SPECIAL_CHARS = frozenset('\\.[]*^$\n')
+SED_REPLACEMENT_SPECIAL_CHARS = frozenset('\\&\n')
+
+# s command flags that have no effect when nothing matches
+SED_NO_MATCH_NOOP_FLAGS = frozenset('gpmM0123456789')
+
+# Bisection retries the same commands, so their parses are kept
+@functools.lru_cache(maxsize=None)
+def parse_sed_substitution(sed_command):
+    """
+    Splits a "sed -i 's/pattern/replacement/flags' file..." command into
+    (pattern, replacement, flags, paths), or returns None for any other form.
+    Escaped delimiters are unescaped as sed does; other escapes are kept.
+    """
+    argv = simple_command_argv(sed_command)
+    if argv is None or len(argv) < 4 or argv[:2] != ["sed", "-i"]:
+        return None
+    script, paths = argv[2], argv[3:]
+    if len(script) < 4 or script[0] != 's' or '\n' in script:
+        return None
+    # A delimiter that is itself special would change meaning once unescaped
+    delimiter = script[1]
+    if delimiter.isalnum() or delimiter in SED_PATTERN_SPECIAL_CHARS:
+        return None
+    if any(path.startswith('-') for path in paths):
+        return None
+
+    parts = []
+    part = []
+    position = 2
+    while len(parts) < 2:
+        if position >= len(script):
+            return None
+        char = script[position]
+        if char == '\\':
+            escaped = script[position + 1:position + 2]
+            part.append(escaped if escaped == delimiter else char + escaped)
+            position += 2
+        elif char == delimiter:
+            parts.append("".join(part))
+            part = []
+            position += 1
+        else:
+            part.append(char)
+            position += 1
+    return parts[0], parts[1], script[position:], tuple(paths)
+
+def apply_literal_substitution(sed_command):
+    """
+    Runs a "sed -i 's/old/new/[g]' file..." command in-process when old and new
+    are plain text, producing the same file contents sed would. Files in which
+    nothing matches are left untouched. Returns the exit status and output, or
+    None if the command needs the real sed.
+    """
+    substitution = parse_sed_substitution(sed_command)
+    if substitution is None:
+        return None
+    old, new, flags, paths = substitution
+    if flags not in ('', 'g'):
+        return None
+    if not old or SED_PATTERN_SPECIAL_CHARS.intersection(old) or SED_REPLACEMENT_SPECIAL_CHARS.intersection(new):
+        return None
+    if not all(os.path.isfile(path) for path in paths):
+        return None
+
+    # sed sees the arguments as the bytes the command line encodes to
+    old = os.fsencode(old)
+    new = os.fsencode(new)
+    try:
+        # Files are handled one after another, so a file named twice is edited twice
+        for path in paths:
+            with open(path, 'rb') as file:
+                data = file.read()
+            if old not in data:
+                continue
+            # Neither string spans lines, so only the per-line first match needs splitting
+            if flags == 'g':
+                data = data.replace(old, new)
+            else:
+                data = b'\n'.join(line.replace(old, new, 1) for line in data.split(b'\n'))
+            write_file(path, data)
+    except OSError as e:
+        return 4, f"sed: {e}\n"
+    return 0, ""
+
+@functools.lru_cache(maxsize=None)
+def required_literal(pattern):
+    """
+    Returns the longest run of plain text that every match of a sed basic
+    regular expression must contain ('' if there is none), or None if the
+    pattern uses alternation, GNU escapes that take an argument (\\cX, \\dNNN,
+    \\oNNN, \\xHH) or cannot be read.
+    """
+    # Literal characters, with None for anything that is not one
+    atoms = []
+    open_groups = []
+    # Where the atom or group a following quantifier would repeat starts
+    last_unit = None
+    position = 0
+    while position < len(pattern):
+        char = pattern[position]
+        position += 1
+        quantifier = False
+        unit = len(atoms)
+        if char == '\\':
+            if position >= len(pattern):
+                return None
+            char = pattern[position]
+            position += 1
+            if char == '|':
+                return None
+            elif char == '(':
+                open_groups.append(len(atoms))
+                last_unit = None
+                continue
+            elif char == ')':
+                if not open_groups:
+                    return None
+                last_unit = open_groups.pop()
+                continue
+            elif char in '?+':
+                quantifier = True
+            elif char == '{':
+                end = pattern.find('\\}', position)
+                if end == -1:
+                    return None
+                position = end + 2
+                quantifier = True
+            elif char in '.*[]^$\\/':
+                atoms.append(char)
+            elif char in 'cdox':
+                # GNU escapes such as \x41 or \cA take characters that are not
+                # matched literally; better to run sed than guess
+                return None
+            else:
+                # Backreferences, classes like \w, anchors like \b and escapes like \n
+                atoms.append(None)
+        elif char == '*':
+            quantifier = True
+        elif char == '[':
+            # Skip a bracket expression; ']' right after '[' or '[^' is a member
+            if pattern.startswith('^', position):
+                position += 1
+            if pattern.startswith(']', position):
+                position += 1
+            while True:
+                if position >= len(pattern):
+                    return None
+                if pattern[position] == ']':
+                    break
+                if pattern[position] == '[' and pattern[position + 1:position + 2] in (':', '.', '='):
+                    end = pattern.find(pattern[position + 1] + ']', position + 2)
+                    if end == -1:
+                        return None
+                    position = end + 2
+                else:
+                    position += 1
+            position += 1
+            atoms.append(None)
+        elif char in '.^$':
+            atoms.append(None)
+        else:
+            atoms.append(char)
+
+        if quantifier:
+            # Whatever the quantifier repeats may match zero times
+            if last_unit is None:
+                atoms.append(None)
+            else:
+                atoms[last_unit:] = [None] * (len(atoms) - last_unit)
+            last_unit = None
+        else:
+            last_unit = unit
+    if open_groups:
+        return None
+
+    runs = "".join(atom if atom is not None else "\0" for atom in atoms).split("\0")
+    return max(runs, key=len)
+
+def sed_cannot_match(sed_command):
+    """
+    Returns True if a "sed -i 's/pattern/.../' file..." command is certain to
+    leave its files unchanged, because text its pattern requires appears in
+    none of them.
+    """
+    substitution = parse_sed_substitution(sed_command)
+    if substitution is None:
+        return False
+    pattern, _, flags, paths = substitution
+    if not SED_NO_MATCH_NOOP_FLAGS.issuperset(flags):
+        return False
+    literal = required_literal(pattern)
+    if not literal:
+        return False
+
+    literal = os.fsencode(literal)
+    try:
+        for path in paths:
+            if not os.path.isfile(path):
+                return False
+            with open(path, 'rb') as file:
+                if literal in file.read():
+                    return False
+    except OSError:
+        return False
+    return True
+
+def chunks(items, size):
+    """
+    Yields consecutive slices of items with at most size elements each.
+    """
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+# ioctl from linux/fs.h that makes a file share another file's extents
+# (copy-on-write clone on btrfs, XFS and similar filesystems)
+FICLONE = 0x40049409
+
+def fast_copy(source_path, target_path):
+    """
+    Copies a file's contents and permission bits. Tries a copy-on-write clone
+    first, then an in-kernel copy_file_range, and only then copies the bytes
+    through Python.
+    """
+    if os.path.exists(target_path) and os.path.samefile(source_path, target_path):
+        raise shutil.SameFileError(f"{source_path!r} and {target_path!r} are the same file")
+
+    with open(source_path, 'rb', buffering=0) as source, open(target_path, 'wb', buffering=0) as target:
+        try:
+            if fcntl is None:
+                raise OSError("copy-on-write clones are not supported on this platform")
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        except OSError:
+            try:
+                remaining = os.fstat(source.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(source.fileno(), target.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            except (OSError, AttributeError):
+                # copy_file_range is Linux-only and not supported by every filesystem
+                source.seek(0)
+                target.seek(0)
+                target.truncate()
+                shutil.copyfileobj(source, target)
+
+    shutil.copymode(source_path, target_path)
+
+def link_or_copy(source_path, backup_path):
+    """
+    Snapshots a file by hardlinking it, falling back to a copy when linking is
+    not possible (e.g. across filesystems). This relies on sed -i writing a new
+    file and renaming it over the original, which leaves the linked snapshot
+    untouched. Copies keep the original's timestamps so an unchanged file can
+    still be recognised by size and modification time.
+    """
+    try:
+        os.link(source_path, backup_path)
+    except OSError:
+        fast_copy(source_path, backup_path)
+        shutil.copystat(source_path, backup_path)
+
+def restore_file(backup_path, original_path):
+    """
+    Moves a snapshot back over the original file. On the same filesystem this
+    is an atomic rename that copies no data; the snapshot is consumed. Across
+    filesystems it falls back to copying. A file that was never rewritten is
+    still the same inode as its hardlinked snapshot, so there is nothing to
+    restore.
+    """
+    try:
+        os.replace(backup_path, original_path)
+    except OSError:
+        try:
+            fast_copy(backup_path, original_path)
+        except shutil.SameFileError:
+            pass
+
+def walk_rs_files(root, build_inputs=None):
+    """
+    Yields the paths of all regular .rs files below root without following
+    directory symlinks or entering sedloop's own scratch directories. Uses
+    os.scandir so file types come from the directory listing rather than a
+    separate stat call per entry. If build_inputs is a list, the paths of the
+    BUILD_INPUT_FILES found along the way, such as the manifests of workspace
+    members, are appended to it.
+    """
+    try:
+        entries = os.scandir(root)
+    except OSError:
+        return
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if not entry.name.startswith(SCRATCH_PREFIX):
+                    yield from walk_rs_files(entry.path, build_inputs)
+            elif entry.name.endswith(".rs") and entry.is_file():
+                yield entry.path
+            elif build_inputs is not None and entry.is_file() and (
+                entry.name in BUILD_INPUT_FILES
+                or os.path.join(os.path.basename(root), entry.name) in BUILD_INPUT_FILES
+            ):
+                build_inputs.append(entry.path)
+
+def results_cache_path():
+    """
+    Returns where cargo results are cached between runs. The target directory
+    is ignored by version control and emptied by cargo clean.
+    """
+    return os.path.join(CARGO_ENV.get("CARGO_TARGET_DIR", "target"), "sedloop-cache.json")
+
+def scratch_parent_dir():
+    """
+    Returns the directory to keep backups and scratch files in: the cargo
+    target directory, which is normally on the same filesystem as the sources,
+    so snapshots can be hardlinks and restores renames. Returns None, meaning
+    the system temporary directory, if it cannot be created.
+    """
+    target_dir = os.path.abspath(CARGO_ENV.get("CARGO_TARGET_DIR", "target"))
+    try:
+        os.makedirs(target_dir, exist_ok=True)
+    except OSError:
+        return None
+    return target_dir
+
+def build_fingerprint():
+    """
+    Returns a digest of everything outside the hashed source tree that can
+    change cargo's diagnostics: the compiler's full version, the cargo command
+    line, RUST* and CARGO* environment variables, cargo's global configuration
+    and the build input files of every directory above the current one, such
+    as the manifests and lock file of an enclosing workspace. Cached results
+    are only valid for the same fingerprint.
+    """
+    cargo = resolve_cargo()
+    _, rustc_version = run_command([CARGO_ENV.get("RUSTC", "rustc"), "-vV"], env=CARGO_ENV)
+
+    cargo_home = CARGO_ENV.get("CARGO_HOME") or os.path.join(os.path.expanduser("~"), ".cargo")
+    paths = [os.path.join(cargo_home, "config"), os.path.join(cargo_home, "config.toml")]
+    directory = os.getcwd()
+    while os.path.dirname(directory) != directory:
+        directory = os.path.dirname(directory)
+        paths.extend(os.path.join(directory, name) for name in BUILD_INPUT_FILES)
+
+    files = {}
+    for path in paths:
+        try:
+            with open(path, 'rb') as file:
+                files[path] = hashlib.blake2b(file.read(), digest_size=16).hexdigest()
+        except OSError:
+            files[path] = None
+
+    inputs = {
+        "command": [cargo, *CARGO_CHECK_ARGS],
+        "rustc": rustc_version,
+        "environment": {name: value for name, value in CARGO_ENV.items() if name.startswith(("CARGO", "RUST"))},
+        "files": files,
+    }
+    return hashlib.blake2b(json.dumps(inputs, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+def load_results_cache(path, fingerprint):
+    """
+    Loads cached cargo results, discarding them if they were produced with a
+    different build fingerprint.
+    """
+    try:
+        with open(path, 'r') as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    if data.get("fingerprint") != fingerprint:
+        return {}
+    return {tree_hash: tuple(counts) for tree_hash, counts in data.get("results", {}).items()}
+
+def save_results_cache(path, fingerprint, results_cache):
+    """
+    Writes cached cargo results for later runs.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as file:
+        json.dump({"fingerprint": fingerprint, "results": results_cache}, file)
+    os.replace(temp_path, path)
 
-def backup_rs_files(source_dir, backup_dir):
+def backup_rs_files(source_dir, backup_dir, build_inputs=None):
     """
     Backs up all .rs files in any subdir of source_dir to backup_dir while remembering their locations.
+    Build input files seen on the way are collected in build_inputs, as by walk_rs_files.
     """
     file_mapping = {}
+    created_dirs = set()
 
-    for root, _, files in os.walk(source_dir):
-        for file in files:
-            if file.endswith(".rs"):
-                full_path = os.path.join(root, file)
-                relative_path = os.path.relpath(full_path, source_dir)
-                backup_path = os.path.join(backup_dir, relative_path)
-                
-                # Create directories in the backup path if they don't exist
-                os.makedirs(os.path.dirname(backup_path), exist_ok=True)
+    for full_path in walk_rs_files(source_dir, build_inputs):
+        relative_path = os.path.relpath(full_path, source_dir)
+        backup_path = os.path.join(backup_dir, relative_path)
 
-                # Copy the .rs file to the backup directory
-                shutil.copy(full_path, backup_path)
+        # Create directories in the backup path if they don't exist
+        backup_parent = os.path.dirname(backup_path)
+        if backup_parent not in created_dirs:
+            os.makedirs(backup_parent, exist_ok=True)
+            created_dirs.add(backup_parent)
 
-                # Store the original location in the mapping
-                file_mapping[backup_path] = full_path
+        # Link (or copy) the .rs file into the backup directory
+        link_or_copy(full_path, backup_path)
+
+        # Store the original location in the mapping
+        file_mapping[backup_path] = full_path
 
     print(f"Backup of all .rs files created in '{backup_dir}'")
     return file_mapping
@@ -91,33 +820,502 @@ def backup_rs_files(source_dir, backup_dir):
 def restore_rs_files(file_mapping):
     """
     Restores the .rs files from their backup locations to their original locations.
+    Only files that changed are touched: a file that is still the same inode as
+    its hardlinked backup, or matches a copied backup's size and modification
+    time, is left alone.
     """
+    restored = 0
     for backup_path, original_path in file_mapping.items():
-        shutil.copy(backup_path, original_path)
-    print("Restored all .rs files from backup.")
+        backup_stat = os.stat(backup_path)
+        try:
+            original_stat = os.stat(original_path)
+        except FileNotFoundError:
+            original_stat = None
+        if original_stat is not None and (
+            (original_stat.st_ino, original_stat.st_dev) == (backup_stat.st_ino, backup_stat.st_dev)
+            or (original_stat.st_size, original_stat.st_mtime_ns) == (backup_stat.st_size, backup_stat.st_mtime_ns)
+        ):
+            continue
+        restore_file(backup_path, original_path)
+        restored += 1
+    print(f"Restored {restored} changed .rs files from backup.")
+
+# Set by --verbose to also report how each batch was evaluated
+verbose = False
+
+def print_detail(message):
+    """
+    Prints a message about how commands are evaluated, in verbose mode only.
+    """
+    if verbose:
+        print(message)
+
+class BatchEvaluator:
+    """
+    Applies batches of sed commands, keeping those that do not raise the total
+    error count above the baseline.
+    """
+
+    def __init__(self, initial_total_errors, tmpdirname, tree_files, results_cache, earlier_results):
+        self.initial_total_errors = initial_total_errors
+        self.tmpdirname = tmpdirname
+
+        # Cargo results keyed on the hash of tree_files, the files cargo reads
+        # that sed commands may change
+        self.tree_files = tree_files
+        self.results_cache = results_cache
+
+        # Keys of results_cache loaded from earlier runs. Not every input cargo
+        # reads is hashed (files pulled in with include_str!, path dependencies
+        # outside the tree), so these may be stale and are only trusted to
+        # reject a batch, never to keep one.
+        self.earlier_results = earlier_results
+
+        # Counts from cargo runs stopped once errors exceeded the baseline. They
+        # are lower bounds, only meaningful against this baseline, so they are
+        # kept out of the shared cache.
+        self.interrupted_results = {}
+
+        # The tree hash is the XOR of per-file digests, so after a batch only
+        # the files it touched need rehashing
+        self.file_digests = {}
+        self.tree_hash = 0
+        self.update_digests(tree_files)
+
+    def update_digests(self, paths):
+        """
+        Rehashes the given files after they changed and updates the tree hash.
+        """
+        for path, digest in hash_files(paths).items():
+            self.tree_hash ^= self.file_digests.get(path, 0) ^ digest
+            self.file_digests[path] = digest
+
+    def evaluate(self, batch):
+        """
+        Applies a batch of sed commands and runs cargo once for all of them.
+        If errors increase, the batch is reverted and each half is retried on
+        its own, narrowing down to the commands responsible. A command whose
+        files cannot be snapshotted, or that fails to run, is dropped on its
+        own, with any edits it made undone, without affecting the rest of the
+        batch.
+        """
+        backup_dir = tempfile.mkdtemp(dir=self.tmpdirname)
+        backups = {}
+        snapshotted = []
+        for command in batch:
+            try:
+                for target_file in sorted(batch_files([command])):
+                    if target_file not in backups:
+                        backup_path = os.path.join(backup_dir, f"{len(backups)}_{os.path.basename(target_file)}")
+                        link_or_copy(target_file, backup_path)
+                        backups[target_file] = backup_path
+            except OSError as e:
+                print(f"Could not snapshot the files of command {command[0]}: {e}. Skipping it.")
+                continue
+            snapshotted.append(command)
+
+        pre_hashes = {target_file: self.file_digests[target_file] for target_file in backups}
+
+        # Apply the sed commands (tentative)
+        applied = []
+        for n, command in enumerate(snapshotted):
+            try:
+                if self.apply(command, os.path.join(backup_dir, f"command_{n}")):
+                    applied.append(command)
+            except Exception as e:
+                print(f"Error running command {command[0]}: {e}. Skipping it.")
+
+        try:
+            if applied:
+                self.settle(applied, backups, pre_hashes)
+            else:
+                for target_file, backup_file in backups.items():
+                    restore_file(backup_file, target_file)
+        except BaseException:
+            # Never keep edits that were not checked. Snapshots already moved
+            # back belong to files that have been restored.
+            self.revert({target_file: backup_file for target_file, backup_file in backups.items()
+                         if os.path.lexists(backup_file)}, pre_hashes)
+            raise
+        finally:
+            shutil.rmtree(backup_dir)
+
+    def apply(self, command, snapshot_dir):
+        """
+        Runs one command of a batch. Returns False if it failed, in which case
+        its files are put back as it found them, leaving the edits of the rest
+        of the batch in place.
+        """
+        idx, sed_command, _ = command
+        print_detail(f"Applying command {idx}: {sed_command}")
+        if sed_cannot_match(sed_command):
+            print_detail("Pattern does not occur in the target files. Skipping the command.")
+            return True
+
+        # Earlier commands of the batch may have edited the same files, so the
+        # batch's snapshots are not what a failed command must be undone to
+        os.mkdir(snapshot_dir)
+        snapshots = {}
+        for target_file in sorted(batch_files([command])):
+            snapshots[target_file] = os.path.join(snapshot_dir, f"{len(snapshots)}_{os.path.basename(target_file)}")
+            link_or_copy(target_file, snapshots[target_file])
+
+        try:
+            result = apply_literal_substitution(sed_command)
+            retcode, output = result if result is not None else run_command(sed_command)
+            if retcode == 0:
+                return True
+            print(f"Failed to run command: {sed_command}. Undoing its changes and skipping it.")
+        except Exception as e:
+            print(f"Error running command {idx}: {e}. Undoing its changes and skipping it.")
+        for target_file, snapshot in snapshots.items():
+            restore_file(snapshot, target_file)
+        return False
+
+    def settle(self, batch, backups, pre_hashes):
+        """
+        Decides whether to keep an applied batch, given snapshots of the files
+        it touches (restored on rejection) and their digests before it ran.
+        """
+        post_hashes = hash_files(backups)
+        if post_hashes == pre_hashes:
+            print(f"No changes were made by {describe_commands(batch)}. Skipping cargo check and test.")
+            # sed -i rewrites files even when nothing matched; putting the
+            # snapshots back keeps the original inodes and timestamps
+            for target_file, backup_file in backups.items():
+                restore_file(backup_file, target_file)
+            return
+
+        self.update_digests(backups)
+
+        # Run cargo check and test again, unless this exact tree was already checked
+        tree_hash = f"{self.tree_hash:032x}"
+        cached = self.results_cache.get(tree_hash)
+        if tree_hash in self.earlier_results and cached[0] + cached[2] <= self.initial_total_errors:
+            print_detail("Rechecking cargo results from an earlier run before keeping the changes.")
+            self.earlier_results.discard(tree_hash)
+            del self.results_cache[tree_hash]
+        if tree_hash in self.results_cache:
+            print_detail("Reusing cargo results for an identical source tree.")
+            counts = self.results_cache[tree_hash]
+        elif tree_hash in self.interrupted_results:
+            print_detail("Reusing cargo results for an identical source tree.")
+            counts = self.interrupted_results[tree_hash]
+        else:
+            counts, finished = run_cargo_checks_until(self.initial_total_errors)
+            if finished:
+                self.results_cache[tree_hash] = counts
+            else:
+                print_detail("Errors exceeded the initial count. Stopped cargo early.")
+                self.interrupted_results[tree_hash] = counts
+        new_check_errors, new_check_warnings, new_test_errors, new_test_warnings = counts
+
+        # Determine error and warning differences
+        new_total_errors = new_check_errors + new_test_errors
+
+        print_detail(f"New check errors: {new_check_errors}, New test errors: {new_test_errors}")
 
-def process_sed_commands():
+        # Ensure that errors never increase
+        if new_total_errors <= self.initial_total_errors:
+            print(f"Changes from {describe_commands(batch)} do not increase errors. Keeping them.")
+            return
+
+        if len(batch) == 1:
+            self.revert(backups, pre_hashes)
+            print(f"Errors have increased after applying {describe_commands(batch)}. Reverting the change.")
+            return
+
+        print_detail(f"Errors have increased after applying {describe_commands(batch)}. Reverting and splitting them.")
+        middle = len(batch) // 2
+        first_half, second_half = batch[:middle], batch[middle:]
+        first_files = batch_files(first_half)
+        if first_files.isdisjoint(batch_files(second_half)):
+            # The second half cannot have affected the first half's files, so
+            # undoing just its files leaves the first half applied on its own
+            self.revert({target_file: backup_file for target_file, backup_file in backups.items()
+                         if target_file not in first_files}, pre_hashes)
+            print_detail(f"Checking commands {first_half[0][0]}-{first_half[-1][0]} without reapplying them.")
+            self.settle(first_half,
+                        {target_file: backups[target_file] for target_file in first_files},
+                        {target_file: pre_hashes[target_file] for target_file in first_files})
+        else:
+            self.revert(backups, pre_hashes)
+            self.evaluate(first_half)
+        self.evaluate(second_half)
+
+    def revert(self, backups, pre_hashes):
+        """
+        Restores files from their snapshots and resets their digests.
+        """
+        for target_file, backup_file in backups.items():
+            restore_file(backup_file, target_file)
+            self.tree_hash ^= self.file_digests[target_file] ^ pre_hashes[target_file]
+            self.file_digests[target_file] = pre_hashes[target_file]
+
+def describe_commands(batch):
+    """
+    Returns how a batch is referred to in messages, e.g. 'commands 3-7'.
+    """
+    if len(batch) == 1:
+        return f"command {batch[0][0]}"
+    return f"commands {batch[0][0]}-{batch[-1][0]}"
+
+def batch_files(batch):
+    """
+    Returns the normalized paths of the files a batch of commands touches.
+    """
+    return {os.path.normpath(target_file) for _, _, target_files in batch for target_file in target_files}
+
+def group_commands(commands):
+    """
+    Splits commands into groups that touch disjoint sets of files, using
+    union-find over their target files. Each group keeps the original order.
+    """
+    parent = {}
+
+    def find(path):
+        parent.setdefault(path, path)
+        while parent[path] != path:
+            parent[path] = parent[parent[path]]
+            path = parent[path]
+        return path
+
+    for _, _, target_files in commands:
+        first_root = find(os.path.abspath(target_files[0]))
+        for target_file in target_files[1:]:
+            root = find(os.path.abspath(target_file))
+            if root != first_root:
+                parent[root] = first_root
+
+    groups = {}
+    for command in commands:
+        groups.setdefault(find(os.path.abspath(command[2][0])), []).append(command)
+    return list(groups.values())
+
+def read_files(paths):
+    """
+    Returns a mapping of each path to its contents, or to None if the file
+    does not exist (e.g. a command deleted it).
+    """
+    contents = {}
+    for path in paths:
+        try:
+            with open(path, 'rb') as file:
+                contents[path] = file.read()
+        except (FileNotFoundError, NotADirectoryError):
+            contents[path] = None
+    return contents
+
+def write_file(path, data):
+    """
+    Replaces a file's contents by writing a temporary file and renaming it over
+    the original, as sed -i does, so hardlinked snapshots keep the old contents.
+    """
+    fd, temp_path = tempfile.mkstemp(prefix=SCRATCH_PREFIX, dir=os.path.dirname(path) or ".")
+    with os.fdopen(fd, 'wb') as file:
+        file.write(data)
+    shutil.copymode(path, temp_path)
+    os.replace(temp_path, path)
+
+def snapshot_copy(source_path, target_path):
+    """
+    copytree copy function for worker workspaces. Only .rs files, which are
+    only ever rewritten by sed -i, are hardlinked; anything cargo might write
+    in place, such as Cargo.lock, gets a real copy.
+    """
+    if source_path.endswith(".rs"):
+        link_or_copy(source_path, target_path)
+    else:
+        fast_copy(source_path, target_path)
+        shutil.copystat(source_path, target_path)
+
+# Set up in each worker process by init_worker
+worker_evaluator = None
+
+def init_worker(source_dir, scratch_parent, initial_counts, tree_files, results_cache, earlier_results,
+                verbose_output):
+    """
+    Gives a worker process its own copy of the source tree and cargo target
+    directory, and checks that the copy builds like the original. Relative
+    path dependencies outside the tree, for instance, would not, in which case
+    the worker declines every group. So does a worker that fails to set up,
+    since an initializer that raises would only be restarted by the pool, over
+    and over.
+    """
+    global persistent_shell, worker_evaluator, verbose
+
+    # A forked worker must not share the parent's shell
+    persistent_shell = None
+    verbose = verbose_output
+
+    scratch_dir = tempfile.mkdtemp(prefix="worker_", dir=scratch_parent)
+    workspace = os.path.join(scratch_dir, "workspace")
+    try:
+        shutil.copytree(
+            source_dir,
+            workspace,
+            symlinks=True,
+            ignore=lambda directory, names: [
+                name for name in names
+                if name.startswith(SCRATCH_PREFIX) or name in VCS_DIRECTORIES
+                or (name == "target" and directory == source_dir)
+            ],
+            copy_function=snapshot_copy
+        )
+        CARGO_ENV["CARGO_TARGET_DIR"] = os.path.join(scratch_dir, "target")
+        os.chdir(workspace)
+
+        if run_cargo_checks() == initial_counts:
+            initial_check_errors, _, initial_test_errors, _ = initial_counts
+            worker_evaluator = BatchEvaluator(
+                initial_check_errors + initial_test_errors, scratch_dir, tree_files, results_cache, earlier_results
+            )
+    except Exception as e:
+        print(f"Could not set up a worker workspace: {e}")
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+def evaluate_group(group):
+    """
+    Evaluates a group of commands in the worker's workspace. Returns the
+    group, its log, the new contents of the files it changed (None for a
+    deleted file; None instead of the mapping if this worker cannot evaluate
+    groups) and the worker's cargo results cache.
+    """
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        if worker_evaluator is None:
+            return group, log.getvalue(), None, {}
+
+        target_files = sorted({target_file for _, _, files in group for target_file in files})
+        before = read_files(target_files)
+        for batch in chunks(group, BATCH_SIZE):
+            try:
+                worker_evaluator.evaluate(batch)
+            except Exception as e:
+                print(f"Error processing commands {batch[0][0]}-{batch[-1][0]}: {e}")
+        after = read_files(target_files)
+
+    changed = {path: data for path, data in after.items() if data != before[path]}
+    return group, log.getvalue(), changed, worker_evaluator.results_cache
+
+def evaluate_in_parallel(commands, jobs, initial_counts, evaluator):
+    """
+    Evaluates groups of commands that touch disjoint files concurrently, each
+    worker in its own hardlinked copy of the tree, then merges the kept changes
+    into the source tree. Returns the commands that still need to be evaluated
+    serially: groups a worker could not handle, or everything if the merged
+    changes interact and increase errors.
+    """
+    # Commands naming absolute paths, or paths that leave the tree, would edit
+    # the real files from a worker
+    parallel_commands = []
+    serial_commands = []
+    for command in commands:
+        if any(os.path.isabs(target_file) or os.path.normpath(target_file).split(os.sep)[0] == os.pardir
+               for target_file in command[2]):
+            serial_commands.append(command)
+        else:
+            parallel_commands.append(command)
+
+    groups = group_commands(parallel_commands)
+    if len(groups) < 2:
+        return commands
+
+    workers = min(jobs, len(groups))
+    print(f"\nEvaluating {len(groups)} independent groups of commands with {workers} workers...")
+
+    merged = {}
+    with multiprocessing.Pool(
+        processes=workers,
+        initializer=init_worker,
+        initargs=(
+            os.getcwd(), evaluator.tmpdirname, initial_counts, evaluator.tree_files, evaluator.results_cache,
+            evaluator.earlier_results, verbose
+        )
+    ) as pool:
+        for group, log, changed, worker_results in pool.imap_unordered(evaluate_group, groups):
+            evaluator.results_cache.update(worker_results)
+            print(f"\nGroup of commands {', '.join(str(idx) for idx, _, _ in group)}:")
+            print(log, end="")
+            if changed is None:
+                print("Worker could not set up a copy of the initial build. Evaluating this group serially.")
+                serial_commands.extend(group)
+            else:
+                merged.update(changed)
+
+    serial_commands.sort(key=lambda command: command[0])
+    if not merged:
+        return serial_commands
+
+    # Snapshot the merged files so the merge can be undone
+    backup_dir = tempfile.mkdtemp(dir=evaluator.tmpdirname)
+    backups = {}
+
+    def undo_merge():
+        for path, backup_path in backups.items():
+            restore_file(backup_path, path)
+        evaluator.update_digests(merged)
+
+    try:
+        for n, path in enumerate(sorted(merged)):
+            backup_path = os.path.join(backup_dir, f"{n}_{os.path.basename(path)}")
+            link_or_copy(path, backup_path)
+            backups[path] = backup_path
+            if merged[path] is None:
+                os.remove(path)
+            else:
+                write_file(path, merged[path])
+        evaluator.update_digests(merged)
+
+        print("\nChecking the merged changes from all groups...")
+        check_errors, check_warnings, test_errors, test_warnings = run_cargo_checks()
+    except BaseException:
+        undo_merge()
+        raise
+    print(f"New check errors: {check_errors}, New test errors: {test_errors}")
+
+    if check_errors + test_errors > evaluator.initial_total_errors:
+        print("Merged changes increase errors. Reverting them and evaluating all commands serially.")
+        undo_merge()
+        return commands
+
+    print("Merged changes do not increase errors. Keeping them.")
+    return serial_commands
+
+def process_sed_commands(jobs=1, verbose_output=False):
     """
     Processes sed commands, applying only if they don't increase the number of errors.
-    Uses an initial backup of .rs files to restore if errors increase.
+    Uses an initial backup of .rs files to restore if errors increase. With jobs > 1,
+    groups of commands that touch disjoint files are evaluated in parallel first.
+    With verbose_output, also reports how each batch was evaluated.
     """
+    global verbose
+    verbose = verbose_output
+
     # Determine the current working directory
     source_dir = os.getcwd()
 
     # Create a temporary directory for the initial backup of .rs files
-    initial_backup_dir = tempfile.mkdtemp(prefix="initial_backup_")
-    file_mapping = backup_rs_files(source_dir, initial_backup_dir)
+    scratch_parent = scratch_parent_dir()
+    initial_backup_dir = tempfile.mkdtemp(prefix=SCRATCH_PREFIX + "initial_backup_", dir=scratch_parent)
+    build_inputs = []
+    file_mapping = backup_rs_files(source_dir, initial_backup_dir, build_inputs)
 
-    try:
-        # Attempt to get sed commands from the clipboard
-        clipboard_content = pyperclip.paste().strip()
+    # Attempt to get sed commands from the clipboard. pyperclip is only imported
+    # for interactive runs, since it probes for clipboard tools by spawning
+    # processes, which is wasted work in scripts and CI.
+    clipboard_content = ""
+    if sys.stdin.isatty():
+        try:
+            import pyperclip
+            clipboard_content = pyperclip.paste().strip()
+        except Exception:
+            clipboard_content = ""
 
-        if clipboard_content.startswith("sed"):
-            sed_commands = [clipboard_content]
-            print(f"Using sed command from clipboard: {clipboard_content}")
-        else:
-            raise PyperclipException  # Fallback to file if clipboard content is not a sed command
-    except PyperclipException:
+    if clipboard_content.startswith("sed"):
+        sed_commands = [clipboard_content]
+        print(f"Using sed command from clipboard: {clipboard_content}")
+    else:
         print("Clipboard unavailable or doesn't contain a sed command. Checking sed.sh file instead.")
         sed_file = 'sed.sh'
         if not os.path.exists(sed_file):
@@ -126,11 +1324,12 @@ def process_sed_commands():
             return
 
         with open(sed_file, 'r') as file:
-            sed_commands = [line.strip() for line in file.readlines() if line.strip()]
+            sed_commands = list(filter(None, (line.strip() for line in file)))
 
     # Initial cargo check and test to get baseline errors and warnings
     print("Running initial cargo check and test...")
-    initial_check_errors, initial_check_warnings, initial_test_errors, initial_test_warnings = run_cargo_checks()
+    initial_counts = run_cargo_checks()
+    initial_check_errors, initial_check_warnings, initial_test_errors, initial_test_warnings = initial_counts
 
     print(f"Initial check errors: {initial_check_errors}, Initial check warnings: {initial_check_warnings}")
     print(f"Initial test errors: {initial_test_errors}, Initial test warnings: {initial_test_warnings}")
@@ -138,59 +1337,74 @@ def process_sed_commands():
     # Store the initial number of errors to ensure they don't increase overall
     initial_total_errors = initial_check_errors + initial_test_errors
 
-    # Temporary directory to store per-command backups
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        for idx, sed_command in enumerate(sed_commands, start=1):
-            print(f"\nProcessing command {idx}: {sed_command}")
+    # Resolve the files each sed command touches up front. The backed up .rs
+    # files are known to exist, so most paths need no stat call.
+    known_files = {os.path.relpath(path, source_dir) for path in file_mapping.values()}
+    is_file_cache = {}
+    commands = []
+    for idx, sed_command in enumerate(sed_commands, start=1):
+        target_files = extract_target_files(sed_command, known_files, is_file_cache)
+        if not target_files:
+            print(f"No valid files found in command: {sed_command}, skipping.")
+            continue
+        commands.append((idx, sed_command, target_files))
+
+    # Everything cargo reads that the sed commands may change, plus the build
+    # input files anywhere in the tree. Results are cached on the hash of these
+    # files and reused by later runs with the same build fingerprint, which
+    # covers most of cargo's other inputs.
+    tree_files = set(known_files)
+    for _, _, target_files in commands:
+        tree_files.update(os.path.normpath(target_file) for target_file in target_files)
+    tree_files.update(os.path.relpath(path, source_dir) for path in build_inputs)
+    tree_files = sorted(tree_files)
 
-            # Extract target files from the sed command
-            target_files = []
+    fingerprint = build_fingerprint()
+    cache_path = results_cache_path()
+    results_cache = load_results_cache(cache_path, fingerprint)
+    # Results from earlier runs may guide the search, but the final verdict
+    # only trusts cargo runs made by this one
+    earlier_results = set(results_cache)
+
+    # Temporary directory to store per-batch backups and parallel workspaces
+    with tempfile.TemporaryDirectory(prefix=SCRATCH_PREFIX, dir=scratch_parent) as tmpdirname:
+        evaluator = BatchEvaluator(initial_total_errors, tmpdirname, tree_files, results_cache, earlier_results)
+        # A batch that leaves the tree as it started needs no cargo run
+        initial_tree_hash = f"{evaluator.tree_hash:032x}"
+        results_cache[initial_tree_hash] = initial_counts
+        earlier_results.discard(initial_tree_hash)
+
+        if jobs > 1:
             try:
-                parts = sed_command.split()
-                for part in parts:
-                    part_clean = part.rstrip(',;')
-                    if os.path.exists(part_clean):
-                        target_files.append(part_clean)
-
-                if not target_files:
-                    print(f"No valid files found in command: {sed_command}, skipping.")
-                    continue
-
-                backups = {}
-                for target_file in target_files:
-                    backup_path = os.path.join(tmpdirname, os.path.basename(target_file))
-                    shutil.copy(target_file, backup_path)
-                    backups[target_file] = backup_path
-
-                # Apply the sed command (tentative)
-                retcode, output = run_command(sed_command)
-                if retcode != 0:
-                    print(f"Failed to run command: {sed_command}, skipping.")
-                    continue
-
-                # Run cargo check and test again
-                new_check_errors, new_check_warnings, new_test_errors, new_test_warnings = run_cargo_checks()
-
-                # Determine error and warning differences
-                new_total_errors = new_check_errors + new_test_errors
-
-                print(f"New check errors: {new_check_errors}, New test errors: {new_test_errors}")
-
-                # Ensure that errors never increase
-                if new_total_errors > initial_total_errors:
-                    print("Errors have increased after applying this sed command. Reverting the change.")
-                    for target_file, backup_file in backups.items():
-                        shutil.copy(backup_file, target_file)
-                else:
-                    print("Change does not increase errors. Keeping the change.")
+                commands = evaluate_in_parallel(commands, jobs, initial_counts, evaluator)
+            except Exception as e:
+                print(f"Error evaluating commands in parallel: {e}. Evaluating all commands serially.")
 
+        for batch in chunks(commands, BATCH_SIZE):
+            first_idx, last_idx = batch[0][0], batch[-1][0]
+            print(f"\nProcessing commands {first_idx}-{last_idx}")
+            try:
+                evaluator.evaluate(batch)
             except Exception as e:
-                print(f"Error processing sed command '{sed_command}': {e}")
+                print(f"Error processing commands {first_idx}-{last_idx}: {e}")
                 continue
 
-    # After all sed commands, perform a final cargo check and test
+    # After all sed commands, perform a final cargo check and test. The final
+    # tree is usually the last one checked during this run, so its results are
+    # often already known.
     print("\nRunning final cargo check and test after applying all sed commands...")
-    final_check_errors, final_check_warnings, final_test_errors, final_test_warnings = run_cargo_checks()
+    evaluator.update_digests(tree_files)
+    tree_hash = f"{evaluator.tree_hash:032x}"
+    if tree_hash in results_cache and tree_hash not in earlier_results:
+        print_detail("Reusing cargo results for an identical source tree.")
+    else:
+        results_cache[tree_hash] = run_cargo_checks()
+    final_check_errors, final_check_warnings, final_test_errors, final_test_warnings = results_cache[tree_hash]
+
+    try:
+        save_results_cache(cache_path, fingerprint, results_cache)
+    except OSError as e:
+        print(f"Could not save cargo results cache to '{cache_path}': {e}")
 
     final_total_errors = final_check_errors + final_test_errors
 
@@ -208,4 +1422,23 @@ def process_sed_commands():
     print("Process completed.")
 
 if __name__ == "__main__":
-    process_sed_commands()
+    parser = argparse.ArgumentParser(description="Apply sed commands that do not increase the number of cargo errors.")
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=1,
+        help="number of worker processes for evaluating independent commands in parallel; "
+             "0 uses half the CPUs (default: 1)"
+    )
+    parser.add_argument(
+        "-v", "--verbose",
+        action="store_true",
+        help="also report cargo results for each batch, cache hits and skipped commands"
+    )
+    args = parser.parse_args()
+    if args.jobs < 0:
+        parser.error("--jobs must not be negative")
+
+    # Each worker runs a full cargo build that uses several cores itself
+    jobs = args.jobs or max(1, (os.cpu_count() or 1) // 2)
+    process_sed_commands(jobs=jobs, verbose_output=args.verbose)
@@ -0,0 +1,142 @@
+"""
+Differential tests comparing the in-process sed shortcuts in sed.py against
+GNU sed itself, on randomly generated commands and files.
+"""
+import os
+import random
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sed
+
+# Number of random commands each test compares
+CASES = 1000
+
+def gnu_sed_available():
+    """
+    Returns True if the sed on PATH is GNU sed, whose -i and regex dialect
+    sed.py is written against.
+    """
+    if shutil.which("sed") is None:
+        return False
+    result = subprocess.run(["sed", "--version"], capture_output=True, text=True)
+    return result.returncode == 0 and "GNU" in result.stdout
+
+def random_text(rng, alphabet, max_length):
+    return "".join(rng.choice(alphabet) for _ in range(rng.randint(0, max_length)))
+
+def sed_script(pattern, replacement, flags, delimiter):
+    """
+    Builds an s command, escaping the delimiter wherever it appears in the
+    pattern or replacement.
+    """
+    escape = lambda text: text.replace(delimiter, '\\' + delimiter)
+    return f"s{delimiter}{escape(pattern)}{delimiter}{escape(replacement)}{delimiter}{flags}"
+
+@unittest.skipUnless(gnu_sed_available(), "GNU sed is not installed")
+class SedDifferentialTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_files(self, contents):
+        paths = []
+        for index, data in enumerate(contents):
+            path = os.path.join(self.directory, f"file{index}.rs")
+            with open(path, 'w') as file:
+                file.write(data)
+            paths.append(path)
+        return paths
+
+    def read_files(self, paths):
+        contents = []
+        for path in paths:
+            with open(path) as file:
+                contents.append(file.read())
+        return contents
+
+    def run_real_sed(self, command):
+        return subprocess.run(command, shell=True, capture_output=True).returncode
+
+    def test_literal_substitution_matches_sed(self):
+        rng = random.Random(1)
+        alphabet = "ab/|,#.&\\*[]^$ \n"
+        handled = 0
+        for case in range(CASES):
+            contents = [random_text(rng, alphabet, 40) for _ in range(rng.randint(1, 2))]
+            pattern = random_text(rng, "ab/|,# ", 3)
+            replacement = random_text(rng, "ab/|,#.*[]^$ ", 3)
+            flags = rng.choice(['', 'g', 'g', 'p'])
+            delimiter = rng.choice("/|,#")
+            paths = self.write_files(contents)
+            # A file named twice is substituted twice
+            if rng.random() < 0.1:
+                paths.append(paths[0])
+            command = "sed -i " + " ".join(shlex.quote(part) for part in [sed_script(pattern, replacement, flags, delimiter), *paths])
+
+            result = sed.apply_literal_substitution(command)
+            if result is None:
+                continue
+            handled += 1
+            ours = self.read_files(paths)
+            self.write_files(contents)
+            self.assertEqual(result[0], self.run_real_sed(command), command)
+            self.assertEqual(ours, self.read_files(paths), command)
+
+        # Most commands are plain literals and must not all fall back to sed
+        self.assertGreater(handled, CASES // 2)
+
+    def test_skipped_commands_leave_files_unchanged(self):
+        rng = random.Random(2)
+        tokens = ['a', 'b', 'c', '.', '*', '\\(', '\\)', '\\+', '\\?', '[ab]', '[^a]', '\\{1,2\\}',
+                  '^', '$', '\\.', '\\*', 'x', '\\w', '\\1', '[]a]', '[[:digit:]]', '1', '/', '\\/',
+                  '\\x41', '\\d065', '\\o101', '\\cA']
+        skipped = 0
+        for case in range(CASES):
+            contents = [random_text(rng, "abcxA1./*() \x01\n", 30) for _ in range(rng.randint(1, 2))]
+            pattern = "".join(rng.choice(tokens) for _ in range(rng.randint(1, 6)))
+            flags = rng.choice(['', 'g', 'p', '2', 'I'])
+            paths = self.write_files(contents)
+            # The pattern is spliced in as written, so its tokens keep their meaning
+            script = f"s/{pattern}/Z/{flags}"
+            command = "sed -i " + " ".join(shlex.quote(part) for part in [script, *paths])
+
+            if not sed.sed_cannot_match(command):
+                continue
+            skipped += 1
+            self.run_real_sed(command)
+            self.assertEqual(contents, self.read_files(paths), command)
+
+        # Patterns with a required literal absent from the files are common enough
+        self.assertGreater(skipped, CASES // 20)
+
+    def test_required_literal_is_in_every_match(self):
+        rng = random.Random(3)
+        tokens = ['a', 'b', '.', '*', '\\(', '\\)', '\\+', '\\?', '[ab]', '\\{1,2\\}', '\\.', 'x', '\\1']
+        checked = 0
+        for case in range(CASES):
+            pattern = "".join(rng.choice(tokens) for _ in range(rng.randint(1, 6)))
+            literal = sed.required_literal(pattern)
+            if not literal:
+                continue
+            text = random_text(rng, "abx.\n", 30)
+            paths = self.write_files([text])
+            # Mark every match, and check each marked span contains the literal
+            script = f"s/{pattern}/<&>/g"
+            if self.run_real_sed("sed -i " + shlex.quote(script) + " " + shlex.quote(paths[0])) != 0:
+                continue
+            checked += 1
+            for match in re.findall(r"<([^<>]*)>", self.read_files(paths)[0]):
+                self.assertIn(literal, match, (pattern, text))
+
+        self.assertGreater(checked, CASES // 10)
+
+if __name__ == "__main__":
+    unittest.main()